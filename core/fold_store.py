@@ -3,6 +3,7 @@
 Fold storage lives at .claude/context-folding/ relative to cwd:
   state.json    - fold index with summaries, scores, metadata
   folds/        - full detail markdown files (fold-001.md, etc.)
+  scores.cache  - last librarian scores, keyed on a hash of their inputs
 """
 
 import json
@@ -11,52 +12,117 @@ import shutil
 from datetime import datetime, timezone
 from pathlib import Path
 
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json module
+    orjson = None
+
 from .token_counter import estimate_tokens
 
 FOLD_DIR = os.path.join(".claude", "context-folding")
 STATE_FILE = "state.json"
+SCORES_CACHE_FILE = "scores.cache"
 FOLDS_DIR = "folds"
 
+# v2: total_summary_tokens is maintained incrementally rather than
+# re-summed on every update.
+STATE_VERSION = 2
+
+# state.json is written compact; set ORIGAMI_DEBUG to pretty-print it.
+PRETTY_STATE = bool(os.environ.get("ORIGAMI_DEBUG"))
+
+
+def display_id(fold_id):
+    """Short form used in injected context, e.g. fold-001 -> F001."""
+    return fold_id.upper().replace("FOLD-", "F")
+
+
+def _loads(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the stdlib (e.g. lone surrogate
+            # escapes the MCP server can write); fall back rather than fail
+            pass
+    return json.loads(data)
+
+
+def _dumps(obj, pretty=False):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except orjson.JSONEncodeError:
+            # Lone surrogates that _loads let through; json escapes them
+            pass
+    return json.dumps(obj, indent=2 if pretty else None).encode("utf-8")
+
 
 class FoldStore:
     def __init__(self, base_dir=None):
         root = Path(base_dir) if base_dir else Path.cwd()
         self.base_dir = root / FOLD_DIR
         self.state_path = self.base_dir / STATE_FILE
+        self.scores_cache_path = self.base_dir / SCORES_CACHE_FILE
         self.folds_path = self.base_dir / FOLDS_DIR
+        self._dirs_ready = False
 
     def ensure_dirs(self):
+        if self._dirs_ready:
+            return
         self.base_dir.mkdir(parents=True, exist_ok=True)
         self.folds_path.mkdir(parents=True, exist_ok=True)
+        self._dirs_ready = True
 
     def load_state(self):
         """Load fold state from disk, or return empty state."""
         if self.state_path.exists():
-            with open(self.state_path, "r", encoding="utf-8") as f:
-                return json.load(f)
+            data = self.state_path.read_bytes()
+            state = _loads(data)
+            if state.get("version", 1) < STATE_VERSION:
+                # One-time recompute so the running total starts out exact
+                state["total_summary_tokens"] = sum(
+                    f.get("summary_tokens", 0) for f in state["folds"]
+                )
+                state["version"] = STATE_VERSION
+            return state
         return {
-            "version": 1,
+            "version": STATE_VERSION,
             "session_id": None,
             "total_summary_tokens": 0,
             "folds": [],
         }
 
     def save_state(self, state):
-        """Write fold state to disk."""
+        """Write fold state to disk (underscore-prefixed caches are dropped).
+
+        Written to a temp file and renamed over state.json, so a crash
+        mid-write never leaves a truncated state file behind.
+        """
         self.ensure_dirs()
-        with open(self.state_path, "w", encoding="utf-8") as f:
-            json.dump(state, f, indent=2)
+        state = {k: v for k, v in state.items() if not k.startswith("_")}
+        data = _dumps(state, pretty=PRETTY_STATE)
+        tmp = self.state_path.with_suffix(".json.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self.state_path)
+
+    def detail_path(self, fold_id):
+        """Path of a fold's detail file (folds/fold-NNN.md)."""
+        return self.folds_path / f"{fold_id}.md"
 
     def save_fold_detail(self, fold_id, content):
         """Write full detail for a fold to folds/fold-NNN.md."""
         self.ensure_dirs()
-        path = self.folds_path / f"{fold_id}.md"
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(content)
+        path = self.detail_path(fold_id)
+        with open(path, "wb") as f:
+            # A lone surrogate (which a transcript line may escape) can't
+            # be encoded; write "?" in its place rather than fail the fold
+            f.write(content.encode("utf-8", "replace"))
 
     def read_fold_detail(self, fold_id):
         """Read full detail for a fold. Returns None if not found."""
-        path = self.folds_path / f"{fold_id}.md"
+        path = self.detail_path(fold_id)
         if path.exists():
             with open(path, "r", encoding="utf-8") as f:
                 return f.read()
@@ -70,16 +136,27 @@ class FoldStore:
         return f"fold-{max_num + 1:03d}"
 
     def add_fold(self, state, fold_id, summary, detail_content,
-                 turn_range, files_touched=None, tags=None):
-        """Create a new fold: save detail to disk, add entry to state."""
+                 turn_range, files_touched=None, tags=None,
+                 summary_tokens=None, detail_tokens=None):
+        """Create a new fold: save detail to disk, add entry to state.
+
+        Token counts are estimated here unless the caller already has
+        them (e.g. from estimate_tokens_batch).
+        """
         self.save_fold_detail(fold_id, detail_content)
 
+        if summary_tokens is None:
+            summary_tokens = estimate_tokens(summary)
+        if detail_tokens is None:
+            detail_tokens = estimate_tokens(detail_content)
+
         fold = {
             "id": fold_id,
+            "display_id": display_id(fold_id),
             "status": "folded",
             "summary": summary,
-            "summary_tokens": estimate_tokens(summary),
-            "detail_tokens": estimate_tokens(detail_content),
+            "summary_tokens": summary_tokens,
+            "detail_tokens": detail_tokens,
             "detail_file": f"folds/{fold_id}.md",
             "turn_range": turn_range,
             "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
@@ -89,47 +166,69 @@ class FoldStore:
         }
 
         state["folds"].append(fold)
-        state["total_summary_tokens"] = sum(
-            f["summary_tokens"] for f in state["folds"]
+        self._index(state)[fold_id] = fold
+        self._ranges(state).add(tuple(turn_range))
+        state["total_summary_tokens"] = (
+            state.get("total_summary_tokens", 0) + fold["summary_tokens"]
         )
         return fold
 
     def update_fold_status(self, state, fold_id, status):
         """Set a fold's status to 'folded' or 'unfolded'."""
-        for fold in state["folds"]:
-            if fold["id"] == fold_id:
-                fold["status"] = status
-                return True
-        return False
+        fold = self._index(state).get(fold_id)
+        if fold is None:
+            return False
+        fold["status"] = status
+        return True
 
     def update_fold_summary(self, state, fold_id, summary):
         """Replace a fold's summary text and recalculate token counts."""
-        for fold in state["folds"]:
-            if fold["id"] == fold_id:
-                fold["summary"] = summary
-                fold["summary_tokens"] = estimate_tokens(summary)
-                state["total_summary_tokens"] = sum(
-                    f["summary_tokens"] for f in state["folds"]
-                )
-                return True
-        return False
+        fold = self._index(state).get(fold_id)
+        if fold is None:
+            return False
+        tokens = estimate_tokens(summary)
+        delta = tokens - fold.get("summary_tokens", 0)
+        fold["summary"] = summary
+        fold["summary_tokens"] = tokens
+        state["total_summary_tokens"] = (
+            state.get("total_summary_tokens", 0) + delta
+        )
+        return True
 
     def update_fold_relevance(self, state, fold_id, score):
         """Update a fold's relevance score."""
-        for fold in state["folds"]:
-            if fold["id"] == fold_id:
-                fold["relevance_score"] = score
-                return True
-        return False
+        fold = self._index(state).get(fold_id)
+        if fold is None:
+            return False
+        fold["relevance_score"] = score
+        return True
 
     def get_fold(self, state, fold_id):
         """Get a single fold entry by ID."""
-        for fold in state["folds"]:
-            if fold["id"] == fold_id:
-                return fold
-        return None
+        return self._index(state).get(fold_id)
+
+    def has_turn_range(self, state, turn_range):
+        """True if some fold already covers exactly this turn range."""
+        return tuple(turn_range) in self._ranges(state)
+
+    def _index(self, state):
+        """Return the id -> fold map, built once and cached in the state."""
+        idx = state.get("_idx")
+        if idx is None:
+            idx = state["_idx"] = {f["id"]: f for f in state["folds"]}
+        return idx
+
+    def _ranges(self, state):
+        """Return the set of folded (start, end) turn ranges, cached in the state."""
+        ranges = state.get("_ranges")
+        if ranges is None:
+            ranges = state["_ranges"] = {
+                tuple(f["turn_range"]) for f in state["folds"]
+            }
+        return ranges
 
     def clear_state(self):
         """Delete all fold state and detail files."""
         if self.base_dir.exists():
             shutil.rmtree(self.base_dir)
+        self._dirs_ready = False
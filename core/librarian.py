@@ -4,24 +4,36 @@ Calls Claude Haiku to evaluate how relevant each fold is to the current
 task context.  Returns a dict of fold_id -> score (0.0-1.0).
 
 Falls back to a flat default score if the API key is missing or the
-call fails, so the rest of the system keeps working.
+call fails, so the rest of the system keeps working.  Successful scores
+can be cached on disk, keyed on a hash of the context and summaries, so
+an unchanged fold set skips the API round-trip.
 """
 
+import asyncio
+import hashlib
 import json
 import os
 import sys
 
 
 DEFAULT_SCORE = 0.3
+MODEL = "claude-haiku-4-5-20251001"
 
+# Folds per Haiku request.  Shards are scored concurrently, so wall time
+# stays roughly flat as the fold count grows instead of one ever-longer
+# prompt.
+SHARD_SIZE = 32
 
-def score_relevance(fold_summaries, current_context, api_key=None):
+
+def score_relevance(fold_summaries, current_context, api_key=None,
+                    cache_path=None):
     """Score each fold's relevance to the current context.
 
     Args:
         fold_summaries: list of {"id": str, "summary": str}
         current_context: the most recent user message / task description
         api_key: Anthropic API key (falls back to ANTHROPIC_API_KEY env var)
+        cache_path: optional file holding the last successful scores
 
     Returns:
         dict mapping fold_id to a float score in [0.0, 1.0]
@@ -33,46 +45,132 @@ def score_relevance(fold_summaries, current_context, api_key=None):
     if not fold_summaries:
         return {}
 
-    try:
-        from anthropic import Anthropic
+    # Nothing to rank against - don't spend a round-trip on it
+    if not current_context:
+        return {f["id"]: DEFAULT_SCORE for f in fold_summaries}
 
-        client = Anthropic(api_key=api_key)
+    key = _cache_key(fold_summaries, current_context)
+    if cache_path:
+        cached = _load_cached_scores(cache_path, key)
+        if cached is not None:
+            return cached
 
-        summaries_text = "\n".join(
-            f"- {f['id']}: {f['summary']}" for f in fold_summaries
+    try:
+        scores, complete = asyncio.run(
+            _score_all(api_key, fold_summaries, current_context)
         )
+    except Exception as exc:
+        print(f"[context-folding] librarian error: {exc}", file=sys.stderr)
+        return {f["id"]: DEFAULT_SCORE for f in fold_summaries}
 
-        response = client.messages.create(
-            model="claude-haiku-4-5-20251001",
-            max_tokens=256,
-            messages=[
-                {
-                    "role": "user",
-                    "content": (
-                        "Rate the relevance (0.0-1.0) of each conversation "
-                        "section to the current task.  Higher = more likely "
-                        "needed.\n\n"
-                        f"Current task/context:\n{current_context}\n\n"
-                        f"Sections:\n{summaries_text}\n\n"
-                        "Return ONLY a JSON object mapping section IDs to "
-                        'scores, e.g. {"fold-001": 0.8, "fold-002": 0.2}'
-                    ),
-                }
-            ],
-        )
+    # Only cache a full answer; a failed shard should be retried next time
+    if cache_path and complete:
+        _save_cached_scores(cache_path, key, scores)
+    return scores
 
-        text = response.content[0].text.strip()
 
-        # Extract JSON even if Haiku wraps it in prose
-        start = text.index("{")
-        end = text.rindex("}") + 1
-        scores = json.loads(text[start:end])
+# ── sharded scoring ─────────────────────────────────────────────────────
 
-        return {
-            fold_id: max(0.0, min(1.0, float(score)))
-            for fold_id, score in scores.items()
-        }
+async def _score_all(api_key, fold_summaries, current_context):
+    """Score shards of at most SHARD_SIZE folds concurrently.
 
-    except Exception as exc:
-        print(f"[context-folding] librarian error: {exc}", file=sys.stderr)
-        return {f["id"]: DEFAULT_SCORE for f in fold_summaries}
+    Returns (scores, complete).  A shard whose call fails gets the default
+    score without discarding the others; ``complete`` is False if any did.
+    """
+    from anthropic import AsyncAnthropic
+
+    shards = [
+        fold_summaries[i:i + SHARD_SIZE]
+        for i in range(0, len(fold_summaries), SHARD_SIZE)
+    ]
+
+    async with AsyncAnthropic(api_key=api_key) as client:
+        results = await asyncio.gather(
+            *(_score_shard(client, shard, current_context) for shard in shards),
+            return_exceptions=True,
+        )
+
+    scores = {}
+    complete = True
+    for shard, result in zip(shards, results):
+        if isinstance(result, Exception):
+            print(f"[context-folding] librarian error: {result}", file=sys.stderr)
+            scores.update({f["id"]: DEFAULT_SCORE for f in shard})
+            complete = False
+        else:
+            scores.update(result)
+    return scores, complete
+
+
+async def _score_shard(client, fold_summaries, current_context):
+    summaries_text = "\n".join(
+        f"- {f['id']}: {f['summary']}" for f in fold_summaries
+    )
+
+    response = await client.messages.create(
+        model=MODEL,
+        max_tokens=512,
+        messages=[
+            {
+                "role": "user",
+                "content": (
+                    "Rate the relevance (0.0-1.0) of each conversation "
+                    "section to the current task.  Higher = more likely "
+                    "needed.\n\n"
+                    f"Current task/context:\n{current_context}\n\n"
+                    f"Sections:\n{summaries_text}\n\n"
+                    "Return ONLY a JSON object mapping section IDs to "
+                    'scores, e.g. {"fold-001": 0.8, "fold-002": 0.2}'
+                ),
+            }
+        ],
+    )
+
+    text = response.content[0].text.strip()
+
+    # Extract JSON even if Haiku wraps it in prose
+    start = text.index("{")
+    end = text.rindex("}") + 1
+    scores = json.loads(text[start:end])
+
+    return {
+        fold_id: max(0.0, min(1.0, float(score)))
+        for fold_id, score in scores.items()
+    }
+
+
+# ── score cache ─────────────────────────────────────────────────────────
+
+def _cache_key(fold_summaries, current_context):
+    # surrogatepass: transcripts and state.json can carry lone surrogates,
+    # which must not turn a cache lookup into a hook failure
+    h = hashlib.blake2b(digest_size=16)
+    h.update(MODEL.encode("utf-8"))
+    h.update(b"\0")
+    h.update(current_context.encode("utf-8", "surrogatepass"))
+    for f in fold_summaries:
+        h.update(b"\0")
+        h.update(f"{f['id']}:{f['summary']}".encode("utf-8", "surrogatepass"))
+    return h.hexdigest()
+
+
+def _load_cached_scores(cache_path, key):
+    """Return cached scores if the cache was written for ``key``."""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if isinstance(cached, dict) and cached.get("key") == key:
+        return cached.get("scores")
+    return None
+
+
+def _save_cached_scores(cache_path, key, scores):
+    """Best-effort write; a failed cache write is not fatal."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "scores": scores}, f)
+    except OSError:
+        pass
@@ -10,3 +10,13 @@ def estimate_tokens(text):
     if not text:
         return 0
     return max(1, int(len(text) / 3.75))
+
+
+def estimate_tokens_batch(texts):
+    """Estimate token counts for many texts in one pass.
+
+    Same result as ``[estimate_tokens(t) for t in texts]``; integer
+    arithmetic (len * 4 // 15 == int(len / 3.75)) avoids the float
+    division per item.
+    """
+    return [max(1, len(t) * 4 // 15) if t else 0 for t in texts]
@@ -5,28 +5,70 @@ turns into sections based on topic boundaries.
 """
 
 import json
+import mmap
+import os
 import re
 
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib json module
+    orjson = None
+
+if orjson is not None:
+    def _loads(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than the stdlib (lone surrogate escapes,
+            # NaN, ...); don't drop input that json accepts
+            return json.loads(data)
+else:
+    _loads = json.loads
+
+# Tool-call path arguments: any "file_path" value, or a "path" value that
+# looks like a file (has an extension).  Structured content is walked
+# directly; the regex is only used on plain-string content.
+_FILE_RE = re.compile(
+    r'"file_path"\s*:\s*"([^"]+)"|"path"\s*:\s*"([^"]+\.\w+)"'
+)
+_FILE_EXT_RE = re.compile(r"\.\w+\Z")
+
+# Transcripts larger than this are memory-mapped rather than streamed
+# through a text file object.
+MMAP_THRESHOLD = 1 << 20  # 1 MB
+
 
 def parse_transcript(transcript_content):
     """Parse a Claude Code transcript into logical sections.
 
+    Accepts the transcript as a string, or as any iterable of JSONL lines
+    (e.g. an open text file) which is consumed one line at a time.
+
     Returns list of sections, each with:
       - turns: list of raw turn dicts
       - turn_range: [start_turn, end_turn]
       - files_touched: list of file paths referenced
       - content: concatenated text content
     """
-    entries = _read_entries(transcript_content)
-    if not entries:
-        return []
+    return parse_entries(_read_entries(transcript_content))
+
 
+def parse_entries(entries):
+    """Group already-decoded transcript entries into sections.
+
+    ``entries`` is an iterable of message dicts (each with a "role") or of
+    transcript lines as decoded, with the message under a "message" key;
+    returns sections in the same shape as parse_transcript.
+    """
     sections = []
     current = _new_section(start_turn=1)
     turn_number = 0
     assistant_turns_since_user = 0
 
     for entry in entries:
+        entry = _as_message(entry)
+        if entry is None:
+            continue
         role = entry.get("role", "")
 
         if role == "user":
@@ -42,11 +84,9 @@ def parse_transcript(transcript_content):
 
         current["turns"].append(entry)
 
-        text = _extract_content(entry)
+        text, files = _extract(entry)
         if text:
             current["content_parts"].append(text)
-
-        files = _extract_files(entry)
         current["files_touched"].update(files)
 
     # Finalize the last section
@@ -56,10 +96,34 @@ def parse_transcript(transcript_content):
     return sections
 
 
+def parse_transcript_stream(f):
+    """Parse a transcript from an open text file without reading it whole."""
+    return parse_transcript(f)
+
+
+def parse_transcript_mmap(path):
+    """Parse a transcript file through a read-only memory map.
+
+    Lines are sliced out of the mapping one at a time, so the page cache
+    backs the data and only the current line is copied into Python.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return []  # empty files cannot be mapped
+        with mm:
+            if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            return parse_transcript(mm)
+
+
 def parse_transcript_file(path):
-    """Convenience: read a transcript file and parse it."""
+    """Convenience: parse a transcript file, mmapping large ones."""
+    if os.path.getsize(path) > MMAP_THRESHOLD:
+        return parse_transcript_mmap(path)
     with open(path, "r", encoding="utf-8") as f:
-        return parse_transcript(f.read())
+        return parse_transcript_stream(f)
 
 
 # ---------------------------------------------------------------------------
@@ -84,44 +148,98 @@ def _finalize(section, end_turn):
     }
 
 
-def _read_entries(text):
-    """Try JSONL first, fall back to single JSON array."""
-    entries = []
-    for line in text.strip().splitlines():
+def _read_entries(source):
+    """Try JSONL first, fall back to single JSON array.
+
+    ``source`` is the transcript text, a memory map of the file, or an
+    iterable of lines.  Entries are yielded as they are decoded; the
+    JSON-array fallback only runs when no line decoded to an entry (for
+    files it seeks back to the start and loads the whole document).
+    """
+    if isinstance(source, str):
+        lines = source.splitlines()
+    elif isinstance(source, mmap.mmap):
+        lines = _mmap_lines(source)
+    else:
+        lines = source
+
+    found = False
+    for entry in _read_entries_iter(lines):
+        found = True
+        yield entry
+
+    if found:
+        return
+
+    # Maybe the whole thing is a JSON array
+    try:
+        if isinstance(source, str):
+            arr = _loads(source)
+        elif hasattr(source, "seek"):
+            source.seek(0)
+            arr = _loads(source.read())
+        else:
+            return
+    except (json.JSONDecodeError, OSError, ValueError):
+        return
+
+    if isinstance(arr, list):
+        for e in arr:
+            if isinstance(e, dict) and "role" in e:
+                yield e
+
+
+def _mmap_lines(mm):
+    """Yield each line of a memory map as bytes, without the newline."""
+    pos = 0
+    size = len(mm)
+    while pos < size:
+        end = mm.find(b"\n", pos)
+        if end == -1:
+            end = size
+        yield mm[pos:end]
+        pos = end + 1
+
+
+def _read_entries_iter(lines):
+    """Yield message dicts from an iterable of JSONL lines (str or bytes)."""
+    for line in lines:
         line = line.strip()
         if not line:
             continue
         try:
-            obj = json.loads(line)
-            # Could be a single message or a wrapper with a message inside
-            if isinstance(obj, dict):
-                if "role" in obj:
-                    entries.append(obj)
-                elif "message" in obj and isinstance(obj["message"], dict):
-                    entries.append(obj["message"])
+            obj = _loads(line)
         except json.JSONDecodeError:
             continue
+        msg = _as_message(obj)
+        if msg is not None:
+            yield msg
 
-    if entries:
-        return entries
 
-    # Maybe the whole thing is a JSON array
-    try:
-        arr = json.loads(text)
-        if isinstance(arr, list):
-            return [e for e in arr if isinstance(e, dict) and "role" in e]
-    except json.JSONDecodeError:
-        pass
+def _as_message(obj):
+    """Return the message dict in a decoded line, or None if there is none."""
+    # Could be a single message or a wrapper with a message inside
+    if isinstance(obj, dict):
+        if "role" in obj:
+            return obj
+        if isinstance(obj.get("message"), dict):
+            return obj["message"]
+    return None
 
-    return []
 
+def _extract(entry):
+    """Pull readable text and referenced file paths from an entry.
 
-def _extract_content(entry):
-    """Pull readable text from a transcript entry."""
+    One pass over the content blocks; file paths come straight from the
+    blocks' dict keys rather than regexing re-serialized JSON.
+    """
     content = entry.get("content", "")
+    files = set()
 
     if isinstance(content, str):
-        return content
+        for match in _FILE_RE.finditer(content):
+            files.add(match.group(1) or match.group(2))
+        return content, files
 
     if isinstance(content, list):
         parts = []
@@ -129,11 +247,14 @@ def _extract_content(entry):
             if isinstance(block, str):
                 parts.append(block)
             elif isinstance(block, dict):
+                _collect_files(block, files)
                 btype = block.get("type", "")
                 if btype == "text":
                     parts.append(block.get("text", ""))
                 elif btype == "tool_use":
                     name = block.get("name", "unknown")
+                    # stdlib rendering keeps stored detail (and its token
+                    # count) independent of whether orjson is installed
                     inp = json.dumps(block.get("input", {}))
                     # Truncate very long tool inputs
                     if len(inp) > 500:
@@ -147,27 +268,27 @@ def _extract_content(entry):
                         for rb in result_content:
                             if isinstance(rb, dict) and rb.get("type") == "text":
                                 parts.append(rb.get("text", "")[:500])
-        return "\n".join(parts)
-
-    return str(content) if content else ""
-
-
-def _extract_files(entry):
-    """Heuristic extraction of file paths from a transcript entry."""
-    files = set()
-    content = entry.get("content", "")
+        return "\n".join(parts), files
 
-    if isinstance(content, list):
-        content = json.dumps(content)
-    elif not isinstance(content, str):
-        content = str(content)
+    return (str(content) if content else ""), files
 
-    # Match tool call file_path arguments
-    for match in re.finditer(r'"file_path"\s*:\s*"([^"]+)"', content):
-        files.add(match.group(1))
 
-    # Match path arguments
-    for match in re.finditer(r'"path"\s*:\s*"([^"]+\.\w+)"', content):
-        files.add(match.group(1))
+def _collect_files(obj, files):
+    """Add file_path / path values found anywhere in a dict/list tree.
 
-    return files
+    Values are the decoded strings, i.e. the real path (``C:\\x\\café.py``),
+    not its JSON-escaped form.
+    """
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            if isinstance(value, str) and value:
+                if key == "file_path" or (
+                    key == "path" and _FILE_EXT_RE.search(value)
+                ):
+                    files.add(value)
+            elif isinstance(value, (dict, list)):
+                _collect_files(value, files)
+    elif isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, (dict, list)):
+                _collect_files(item, files)
@@ -14,58 +14,92 @@ Input (stdin JSON):
   { "session_id": "...", "transcript_path": "...", "trigger": "auto|manual", ... }
 
 Output: none (exit 0 to allow compaction to proceed)
+
+``run(stdin_text)`` runs the same logic in-process and returns
+(stdout, stderr, exit_code) instead of exiting.  In-process callers that
+already hold the decoded transcript lines (or their message dicts) can
+pass them as ``prefetched_turns`` to skip reading the transcript file.
 """
 
+import contextlib
+import io
 import json
 import os
 import sys
+import traceback
 
 # Resolve plugin root so core/ imports work regardless of cwd
 _PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, _PLUGIN_ROOT)
 
 from core.fold_store import FoldStore
-from core.transcript_parser import parse_transcript
+from core.transcript_parser import parse_entries, parse_transcript_file
 from core.librarian import score_relevance
+from core.token_counter import estimate_tokens_batch
 
 
 def main():
-    # ── Read hook input ───────────────────────────────────────────────
-    try:
-        hook_input = json.loads(sys.stdin.read())
-    except (json.JSONDecodeError, Exception):
-        hook_input = {}
+    sys.exit(_precompact(sys.stdin.read()))
 
-    transcript_path = hook_input.get("transcript_path", "")
-    if not transcript_path or not os.path.exists(transcript_path):
-        sys.exit(0)  # nothing to do, let compaction proceed
 
-    with open(transcript_path, "r", encoding="utf-8") as f:
-        transcript_content = f.read()
+def run(stdin_text, *, prefetched_turns=None):
+    """Run the hook in-process.  Returns (stdout, stderr, exit_code)."""
+    out, err = io.StringIO(), io.StringIO()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            rc = _precompact(stdin_text, prefetched_turns)
+        except Exception:
+            # Report like a crashed subprocess instead of raising into
+            # the caller
+            rc = 1
+            err.write(traceback.format_exc())
+    return out.getvalue(), err.getvalue(), rc
 
-    if not transcript_content.strip():
-        sys.exit(0)
 
-    # ── Parse transcript into sections ────────────────────────────────
+def _precompact(stdin_text, prefetched_turns=None):
     store = FoldStore()
-    state = store.load_state()
 
-    sections = parse_transcript(transcript_content)
-    if not sections:
-        sys.exit(0)
+    if prefetched_turns is not None:
+        # Caller already decoded the transcript - no hook input needed
+        sections = parse_entries(prefetched_turns)
+    else:
+        # ── Read hook input ───────────────────────────────────────────
+        try:
+            hook_input = json.loads(stdin_text)
+        except (json.JSONDecodeError, Exception):
+            hook_input = {}
+
+        transcript_path = hook_input.get("transcript_path", "")
+        if not transcript_path or not os.path.exists(transcript_path):
+            return 0  # nothing to do, let compaction proceed
+
+        # ── Parse transcript into sections ────────────────────────────
+        # Streamed line by line (memory-mapped when large) - transcripts
+        # can run to hundreds of MB
+        sections = parse_transcript_file(transcript_path)
 
-    # Skip sections we already folded (match on turn_range)
-    existing_ranges = {tuple(f["turn_range"]) for f in state["folds"]}
+    if not sections:
+        return 0
 
-    for section in sections:
-        tr = tuple(section["turn_range"])
-        if tr in existing_ranges:
-            continue
+    state = store.load_state()
+    store.ensure_dirs()  # once up front; fold writes below reuse it
 
+    # Skip sections we already folded (match on turn_range)
+    new_sections = [
+        s for s in sections if not store.has_turn_range(state, s["turn_range"])
+    ]
+
+    # Placeholder summaries - model refines via write_summary MCP tool later
+    placeholders = [
+        s["content"][:200].replace("\n", " ").strip() for s in new_sections
+    ]
+    summary_tokens = estimate_tokens_batch(placeholders)
+    detail_tokens = estimate_tokens_batch([s["content"] for s in new_sections])
+
+    for section, placeholder, stok, dtok in zip(
+        new_sections, placeholders, summary_tokens, detail_tokens
+    ):
         fold_id = store.next_fold_id(state)
-        # Placeholder summary - model refines via write_summary MCP tool later
-        placeholder = section["content"][:200].replace("\n", " ").strip()
-
         store.add_fold(
             state,
             fold_id,
@@ -73,6 +107,8 @@ def main():
             detail_content=section["content"],
             turn_range=list(section["turn_range"]),
             files_touched=section.get("files_touched", []),
+            summary_tokens=stok,
+            detail_tokens=dtok,
         )
 
     # ── Extract current context for the librarian ─────────────────────
@@ -84,7 +120,9 @@ def main():
             {"id": f["id"], "summary": f["summary"]}
             for f in state["folds"]
         ]
-        scores = score_relevance(summaries, current_context)
+        scores = score_relevance(
+            summaries, current_context, cache_path=store.scores_cache_path
+        )
 
         threshold = 0.7  # aggressive: only unfold highly relevant sections
         for fold in state["folds"]:
@@ -94,7 +132,7 @@ def main():
 
     # ── Persist ───────────────────────────────────────────────────────
     store.save_state(state)
-    sys.exit(0)
+    return 0
 
 
 # ── helpers ────────────────────────────────────────────────────────────
@@ -10,16 +10,23 @@ Input (stdin JSON):
 
 Output (stdout, exit 0):
   Text to inject into the conversation context
+
+``run(stdin_text)`` runs the same logic in-process and returns
+(stdout, stderr, exit_code) instead of exiting.
 """
 
+import contextlib
+import io
 import json
 import os
+import shutil
 import sys
+import traceback
 
 _PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, _PLUGIN_ROOT)
 
-from core.fold_store import FoldStore
+from core.fold_store import FoldStore, display_id
 from core.token_counter import estimate_tokens
 
 
@@ -34,9 +41,28 @@ MAX_UNFOLDED = 3  # never unfold more than 3 sections at once
 
 
 def main():
+    sys.exit(_sessionstart(sys.stdin.read(), sys.stdout.buffer))
+
+
+def run(stdin_text):
+    """Run the hook in-process.  Returns (stdout, stderr, exit_code)."""
+    out, err = io.BytesIO(), io.StringIO()
+    with contextlib.redirect_stderr(err):
+        try:
+            rc = _sessionstart(stdin_text, out)
+        except Exception:
+            # Report like a crashed subprocess instead of raising into
+            # the caller
+            rc = 1
+            err.write(traceback.format_exc())
+    return out.getvalue().decode("utf-8"), err.getvalue(), rc
+
+
+def _sessionstart(stdin_text, stdout):
+    """Build and write the injection to the binary stream ``stdout``."""
     # ── Read hook input ───────────────────────────────────────────────
     try:
-        hook_input = json.loads(sys.stdin.read())
+        hook_input = json.loads(stdin_text)
     except (json.JSONDecodeError, Exception):
         hook_input = {}
 
@@ -46,64 +72,79 @@ def main():
     state = store.load_state()
 
     if not state["folds"]:
-        sys.exit(1)  # nothing to inject
+        return 1  # nothing to inject
 
     # ── Token budget management ───────────────────────────────────────
-    # Summaries always included
-    used = sum(f.get("summary_tokens", 0) for f in state["folds"])
+    # Summaries always included.  FoldStore and the MCP server keep the
+    # running total current, so there's no need to re-sum every fold.
+    used = state.get("total_summary_tokens")
+    if used is None:
+        used = sum(f.get("summary_tokens", 0) for f in state["folds"])
     remaining = BUDGET - used
 
-    # Greedily unfold by relevance score within budget
-    by_relevance = sorted(
-        state["folds"],
+    # Greedily unfold by relevance score within budget.  Only folds the
+    # librarian marked unfolded are candidates, so sort just those.
+    candidates = sorted(
+        (f for f in state["folds"] if f["status"] == "unfolded"),
         key=lambda f: f.get("relevance_score", 0),
         reverse=True,
     )
 
     unfold_ids = set()
-    for fold in by_relevance:
-        if fold["status"] == "unfolded":
-            dtok = fold.get("detail_tokens", 0)
-            if dtok <= remaining and len(unfold_ids) < MAX_UNFOLDED:
-                unfold_ids.add(fold["id"])
-                remaining -= dtok
-            else:
-                fold["status"] = "folded"  # over budget or cap hit
-
-    # ── Build context injection ───────────────────────────────────────
+    for fold in candidates:
+        dtok = fold.get("detail_tokens", 0)
+        if dtok <= remaining and len(unfold_ids) < MAX_UNFOLDED:
+            unfold_ids.add(fold["id"])
+            remaining -= dtok
+        else:
+            fold["status"] = "folded"  # over budget or cap hit
+
+    # ── Persist any budget-forced status changes ──────────────────────
+    store.save_state(state)
+
+    # ── Emit context injection ────────────────────────────────────────
+    # Output goes to stdout as UTF-8 bytes.  Unfolded detail files are
+    # copied straight through rather than read into Python strings, so
+    # the text buffered so far is flushed ahead of each one.
     total_stored = sum(f.get("detail_tokens", 0) for f in state["folds"])
-    lines = [
+    out = io.StringIO()
+    out.write(
         f"[CONTEXT FOLDING - {len(state['folds'])} sections, "
-        f"{total_stored} tokens stored]",
-        "",
-    ]
+        f"{total_stored} tokens stored]\n\n"
+    )
 
     for fold in state["folds"]:
-        fid = fold["id"].upper().replace("FOLD-", "F")
+        fid = fold.get("display_id") or display_id(fold["id"])
         status = fold["status"].upper()
         dtok = fold.get("detail_tokens", 0)
         rel = fold.get("relevance_score", 0)
 
-        lines.append(f"[{fid} | {status} | {dtok} tok | rel:{rel:.2f}]")
-        lines.append(fold.get("summary", ""))
+        out.write(f"[{fid} | {status} | {dtok} tok | rel:{rel:.2f}]\n")
+        out.write(f"{fold.get('summary', '')}\n")
 
         if fold["id"] in unfold_ids:
-            detail = store.read_fold_detail(fold["id"])
-            if detail:
-                lines.append("")
-                lines.append("--- FULL DETAIL ---")
-                lines.append(detail)
-                lines.append("--- END DETAIL ---")
-
-        lines.append("")
-
-    lines.append("Call the origami_guide tool for instructions on using context folding.")
-
-    # ── Persist any budget-forced status changes ──────────────────────
-    store.save_state(state)
-
-    sys.stdout.write("\n".join(lines))
-    sys.exit(0)
+            path = store.detail_path(fold["id"])
+            if path.exists() and path.stat().st_size:
+                out.write("\n--- FULL DETAIL ---\n")
+                _flush(out, stdout)
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, stdout, 1 << 20)
+                out.write("\n--- END DETAIL ---\n")
+
+        out.write("\n")
+
+    out.write("Call the origami_guide tool for instructions on using context folding.")
+    _flush(out, stdout)
+    stdout.flush()
+    return 0
+
+
+def _flush(out, stdout):
+    """Write buffered text to the binary stdout and reset the buffer."""
+    # "replace" keeps a lone surrogate in a summary from aborting output
+    stdout.write(out.getvalue().encode("utf-8", "replace"))
+    out.seek(0)
+    out.truncate()
 
 
 if __name__ == "__main__":
@@ -47,7 +47,7 @@ function loadState() {
   try {
     return JSON.parse(fs.readFileSync(STATE_FILE, "utf-8"));
   } catch {
-    return { version: 1, session_id: null, total_summary_tokens: 0, folds: [] };
+    return { version: 2, session_id: null, total_summary_tokens: 0, folds: [] };
   }
 }
 
@@ -7,56 +7,114 @@ Simulates the full lifecycle:
   3. Verify fold state on disk
   4. SessionStart hook: inject folded context
   5. MCP server: origami_guide, list_folds, unfold, write_summary, fold
+
+Hooks run in-process through their run() entry points; set E2E_ISOLATE=1
+to run each one in a fresh interpreter instead.
 """
 
+import functools
+import itertools
 import json
 import os
+import re
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
+from concurrent.futures import Future
+
+try:
+    import orjson as _j
+
+    def dumps(obj):
+        return _j.dumps(obj).decode("utf-8")
+
+    loads = _j.loads
+except ImportError:
+    import json as _j
+
+    def dumps(obj):
+        return _j.dumps(obj, separators=(",", ":"))
+
+    loads = _j.loads
 
 PLUGIN_ROOT = os.path.dirname(os.path.abspath(__file__))
+HOOKS_DIR = os.path.join(PLUGIN_ROOT, "hooks")
+PRECOMPACT_PY = os.path.join(HOOKS_DIR, "precompact.py")
+SESSIONSTART_PY = os.path.join(HOOKS_DIR, "sessionstart.py")
+SERVER_JS = os.path.join(PLUGIN_ROOT, "server", "index.js")
+sys.path.insert(0, HOOKS_DIR)
+
+import precompact  # noqa: E402
+import sessionstart  # noqa: E402
+
+# In-process entry point for each hook script
+HOOKS = {
+    PRECOMPACT_PY: precompact.run,
+    SESSIONSTART_PY: sessionstart.run,
+}
+
 FOLD_DIR = os.path.join(PLUGIN_ROOT, ".claude", "context-folding")
 PYTHON = sys.executable
-NODE = "node"
-
-# Try to find node
-for candidate in [
+# PATH lookup first; the literal install locations only matter on Windows
+# setups where node isn't on PATH
+NODE = shutil.which("node") or next(
+    (c for c in [
+        r"C:\Program Files\nodejs\node.exe",
+        "/c/Program Files/nodejs/node.exe",
+    ] if os.path.exists(c)),
     "node",
-    r"C:\Program Files\nodejs\node.exe",
-    "/c/Program Files/nodejs/node.exe",
-]:
-    try:
-        subprocess.run([candidate, "--version"], capture_output=True, timeout=5)
-        NODE = candidate
-        break
-    except Exception:
-        continue
+)
 
 PASS = 0
 FAIL = 0
+_LOG = []  # buffered PASS lines, written once per phase
 
 
 def check(label, condition, detail=""):
     global PASS, FAIL
     if condition:
         PASS += 1
-        print(f"  PASS  {label}")
+        _LOG.append(f"  PASS  {label}\n")
     else:
         FAIL += 1
+        # Failures print immediately (after anything buffered before them)
+        flush_log()
         print(f"  FAIL  {label}")
         if detail:
             print(f"        {detail}")
 
 
+def flush_log():
+    sys.stdout.write("".join(_LOG))
+    _LOG.clear()
+
+
+def phase(title):
+    """Flush the previous phase's results and print the next header."""
+    flush_log()
+    print(f"\n--- {title} ---")
+
+
 def cleanup():
-    if os.path.exists(FOLD_DIR):
-        shutil.rmtree(FOLD_DIR)
+    shutil.rmtree(FOLD_DIR, ignore_errors=True)
+
 
+def load_state_cached(path, _cache={}):
+    """Parse state.json, reusing the last parse while the file is unchanged."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    if _cache.get("stamp") != stamp:
+        with open(path, "rb") as f:
+            _cache["state"] = loads(f.read())
+        _cache["stamp"] = stamp
+    return _cache["state"]
 
+
+@functools.lru_cache(maxsize=1)
 def build_transcript():
-    """Build a realistic multi-topic conversation transcript."""
+    """Build a realistic multi-topic conversation transcript (JSONL bytes)."""
     turns = [
         # Topic 1: Auth middleware bug (turns 1-5)
         {"role": "user", "content": "There's a bug in auth.middleware.ts - JWT tokens aren't being validated properly"},
@@ -99,62 +157,147 @@ def build_transcript():
             {"type": "tool_use", "name": "Write", "input": {"file_path": "tests/profile.test.ts"}},
         ]},
     ]
-    return "\n".join(json.dumps(t) for t in turns)
+    return "\n".join(dumps(t) for t in turns).encode("utf-8")
+
+
+def run_hook(script_path, stdin_data, **kwargs):
+    """Run a Python hook with JSON on stdin, in-process unless E2E_ISOLATE.
+
+    Extra keyword arguments go to the hook's in-process run(); the
+    subprocess path ignores them and relies on stdin alone.
+    """
+    if os.environ.get("E2E_ISOLATE"):
+        return subprocess.run(
+            [PYTHON, script_path],
+            input=stdin_data,
+            capture_output=True,
+            text=True,
+            cwd=PLUGIN_ROOT,
+        )
+
+    prev_cwd = os.getcwd()
+    os.chdir(PLUGIN_ROOT)
+    try:
+        stdout, stderr, rc = HOOKS[script_path](stdin_data, **kwargs)
+    finally:
+        os.chdir(prev_cwd)
+    return subprocess.CompletedProcess(script_path, rc, stdout, stderr)
 
 
-def run_hook(script, stdin_data):
-    """Run a Python hook script with JSON on stdin."""
-    result = subprocess.run(
-        [PYTHON, os.path.join(PLUGIN_ROOT, "hooks", script)],
-        input=stdin_data,
-        capture_output=True,
-        text=True,
-        cwd=PLUGIN_ROOT,
-    )
-    return result
+# ── MCP server (one process, reused across phases) ─────────────────────
+#
+# A background thread drains the server's stdout and resolves one Future
+# per request id, so several requests can be in flight at once.
 
+MCP_TIMEOUT = 10  # seconds to wait for any single response
+NOT_FOUND_ARGS = {"fold_id": "fold-999"}  # shared by the phase 9 error cases
 
-def mcp_call(method, params=None, req_id=1):
-    """Send a JSON-RPC request to the MCP server and return the response."""
-    messages = [
-        # Initialize
-        json.dumps({
-            "jsonrpc": "2.0", "id": 0, "method": "initialize",
-            "params": {
-                "protocolVersion": "2024-11-05",
-                "capabilities": {},
-                "clientInfo": {"name": "test", "version": "1.0.0"},
-            },
-        }),
-        # The actual request
-        json.dumps({
-            "jsonrpc": "2.0", "id": req_id, "method": method,
-            "params": params or {},
-        }),
-    ]
-    stdin_data = "\n".join(messages) + "\n"
+_mcp_proc = None
+_mcp_ids = itertools.count(1)
+_mcp_send_lock = threading.Lock()
+_mcp_futures = {}
 
-    result = subprocess.run(
-        [NODE, os.path.join(PLUGIN_ROOT, "server", "index.js")],
-        input=stdin_data,
-        capture_output=True,
-        text=True,
+
+def mcp_start():
+    """Start the MCP server once and perform the initialize handshake."""
+    global _mcp_proc
+    _mcp_proc = subprocess.Popen(
+        [NODE, SERVER_JS],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
         cwd=PLUGIN_ROOT,
-        timeout=10,
     )
+    threading.Thread(target=_mcp_read_loop, daemon=True).start()
+    return mcp_call("initialize", {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "test", "version": "1.0.0"},
+    })
+
+
+def mcp_stop():
+    if _mcp_proc is None:
+        return
+    _mcp_proc.stdin.close()
+    try:
+        _mcp_proc.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        _mcp_proc.kill()
 
-    # Parse responses - find our request's response
-    for line in result.stdout.strip().split("\n"):
+
+def _mcp_recv():
+    """Read one Content-Length framed body as bytes; None if the server closed."""
+    length = None
+    while True:
+        line = _mcp_proc.stdout.readline()
+        if not line:
+            return None
         line = line.strip()
         if not line:
+            if length is not None:
+                break
             continue
-        try:
-            resp = json.loads(line)
-            if isinstance(resp, dict) and resp.get("id") == req_id:
-                return resp
-        except json.JSONDecodeError:
+        name, _, value = line.partition(b":")
+        if name.strip().lower() == b"content-length":
+            length = int(value)
+    return _mcp_proc.stdout.read(length)
+
+
+def _mcp_read_loop():
+    """Reader thread: hand each response to the Future waiting on its id.
+
+    The server emits compact JSON (JSON.stringify), so a frame that can be
+    a reply to a pending request must contain the bytes '"id":<N>'.  Frames
+    without any such needle (notifications, stale replies) are skipped
+    unparsed; a needle hit is still parsed and its id verified.
+    """
+    while True:
+        body = _mcp_recv()
+        if body is None:
+            break
+        if not any(b'"id":%d' % req_id in body for req_id in list(_mcp_futures)):
             continue
-    return None
+        resp = loads(body)
+        if isinstance(resp, dict):
+            fut = _mcp_futures.pop(resp.get("id"), None)
+            if fut is not None:
+                fut.set_result(resp)
+    # Server went away - unblock anyone still waiting
+    while _mcp_futures:
+        _, fut = _mcp_futures.popitem()
+        fut.set_result(None)
+
+
+def mcp_send(calls):
+    """Pipeline requests in one write; returns a Future per (method, params)."""
+    frames = []
+    futures = []
+    for method, params in calls:
+        req_id = next(_mcp_ids)
+        # ASCII-only (non-ASCII as \u escapes): the server compares
+        # Content-Length with the length of its decoded string buffer,
+        # so byte and character counts must agree
+        body = json.dumps({
+            "jsonrpc": "2.0", "id": req_id, "method": method,
+            "params": params or {},
+        }, separators=(",", ":")).encode("ascii")
+        frames.append(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        fut = _mcp_futures[req_id] = Future()
+        futures.append(fut)
+    with _mcp_send_lock:
+        _mcp_proc.stdin.write(b"".join(frames))
+        _mcp_proc.stdin.flush()
+    return futures
+
+
+def mcp_call_async(method, params=None):
+    """Send one JSON-RPC request; returns a Future for its response."""
+    return mcp_send([(method, params)])[0]
+
+
+def mcp_call(method, params=None):
+    """Send a JSON-RPC request to the MCP server and return the response."""
+    return mcp_call_async(method, params).result(timeout=MCP_TIMEOUT)
 
 
 def main():
@@ -164,19 +307,18 @@ def main():
 
     # ── Setup ─────────────────────────────────────────────────────
     cleanup()
-    transcript = build_transcript()
-
-    with tempfile.NamedTemporaryFile(
-        mode="w", suffix=".jsonl", delete=False, dir=PLUGIN_ROOT
-    ) as f:
-        f.write(transcript)
-        transcript_path = os.path.abspath(f.name)
+    fd, transcript_path = tempfile.mkstemp(suffix=".jsonl", dir=PLUGIN_ROOT)
+    try:
+        os.write(fd, build_transcript())
+    finally:
+        os.close(fd)
+    transcript_path = os.path.abspath(transcript_path)
 
     try:
         # ── Phase 1: PreCompact Hook ──────────────────────────────
-        print("\n--- Phase 1: PreCompact Hook ---")
-        hook_input = json.dumps({"transcript_path": transcript_path})
-        result = run_hook("precompact.py", hook_input)
+        phase("Phase 1: PreCompact Hook")
+        hook_input = dumps({"transcript_path": transcript_path})
+        result = run_hook(PRECOMPACT_PY, hook_input)
 
         check("precompact exits 0", result.returncode == 0,
               f"exit={result.returncode}, stderr={result.stderr[:200]}")
@@ -184,28 +326,33 @@ def main():
               f"stdout should be empty, got {len(result.stdout)} chars")
 
         # ── Phase 2: Verify Fold State ────────────────────────────
-        print("\n--- Phase 2: Verify Fold State ---")
+        phase("Phase 2: Verify Fold State")
         state_path = os.path.join(FOLD_DIR, "state.json")
         check("state.json exists", os.path.exists(state_path))
 
-        with open(state_path) as f:
-            state = json.load(f)
+        state = load_state_cached(state_path)
+        by_id = {f["id"]: f for f in state["folds"]}
 
         num_folds = len(state["folds"])
         check(f"created folds (got {num_folds})", num_folds >= 3,
               f"expected >=3 sections from 4-topic transcript")
-        check("version is 1", state["version"] == 1)
+        check("version is 2", state["version"] == 2)
         check("total_summary_tokens > 0", state["total_summary_tokens"] > 0)
 
-        # Check individual folds
-        for fold in state["folds"]:
-            fid = fold["id"]
-            check(f"{fid} has summary", len(fold["summary"]) > 0)
-            check(f"{fid} has detail_tokens", fold["detail_tokens"] > 0)
-            check(f"{fid} has timestamp", len(fold.get("timestamp", "")) > 0)
-
-            detail_path = os.path.join(FOLD_DIR, fold["detail_file"])
-            check(f"{fid} detail file exists", os.path.exists(detail_path))
+        # Check individual folds - one directory listing for all detail files
+        with os.scandir(os.path.join(FOLD_DIR, "folds")) as it:
+            detail_files = {e.name for e in it if e.is_file()}
+
+        for fid, fold in by_id.items():
+            summary = fold["summary"]
+            dtok = fold["detail_tokens"]
+            ts = fold.get("timestamp", "")
+            check(f"{fid} has summary, detail_tokens, timestamp",
+                  len(summary) > 0 and dtok > 0 and len(ts) > 0,
+                  f"summary={len(summary)} chars, detail_tokens={dtok}, "
+                  f"timestamp={ts!r}")
+            check(f"{fid} detail file exists",
+                  os.path.basename(fold["detail_file"]) in detail_files)
 
         # Check relevance scores (without API key, should be 0.3 default)
         scores = [f["relevance_score"] for f in state["folds"]]
@@ -214,8 +361,8 @@ def main():
               f"scores={scores}")
 
         # ── Phase 3: SessionStart Hook ────────────────────────────
-        print("\n--- Phase 3: SessionStart Hook ---")
-        result2 = run_hook("sessionstart.py", json.dumps({"source": "compact"}))
+        phase("Phase 3: SessionStart Hook")
+        result2 = run_hook(SESSIONSTART_PY, dumps({"source": "compact"}))
 
         check("sessionstart exits 0", result2.returncode == 0,
               f"exit={result2.returncode}, stderr={result2.stderr[:200]}")
@@ -225,15 +372,24 @@ def main():
         check("output references origami_guide",
               "origami_guide" in result2.stdout)
 
-        # Check fold IDs appear in output
+        # Check fold IDs appear in output - one scan collects every F-id
+        found = set(re.findall(r"\bF\d{3,}\b", result2.stdout))
         for fold in state["folds"]:
             fid = fold["id"].upper().replace("FOLD-", "F")
-            check(f"{fid} in sessionstart output", fid in result2.stdout)
+            check(f"{fid} in sessionstart output", fid in found)
 
         # ── Phase 4: MCP Server - origami_guide ───────────────────
-        print("\n--- Phase 4: MCP Server - origami_guide ---")
-        resp = mcp_call("tools/call", {"name": "origami_guide", "arguments": {}})
+        phase("Phase 4: MCP Server - origami_guide")
+        init = mcp_start()
+        check("MCP server initializes", init is not None and "result" in init)
 
+        # Phases 4 and 5 only read, so both requests are in flight together
+        fut_guide = mcp_call_async(
+            "tools/call", {"name": "origami_guide", "arguments": {}})
+        fut_list = mcp_call_async(
+            "tools/call", {"name": "list_folds", "arguments": {}})
+
+        resp = fut_guide.result(timeout=MCP_TIMEOUT)
         check("origami_guide returns response", resp is not None)
         if resp and "result" in resp:
             text = resp["result"]["content"][0]["text"]
@@ -243,11 +399,11 @@ def main():
                   "aggressive" in text.lower() or "lean" in text.lower())
         else:
             check("guide has result content", False,
-                  f"resp={json.dumps(resp)[:200] if resp else 'None'}")
+                  f"resp={dumps(resp)[:200] if resp else 'None'}")
 
         # ── Phase 5: MCP Server - list_folds ──────────────────────
-        print("\n--- Phase 5: MCP Server - list_folds ---")
-        resp = mcp_call("tools/call", {"name": "list_folds", "arguments": {}})
+        phase("Phase 5: MCP Server - list_folds")
+        resp = fut_list.result(timeout=MCP_TIMEOUT)
 
         check("list_folds returns response", resp is not None)
         if resp and "result" in resp:
@@ -256,7 +412,7 @@ def main():
             check("list shows token counts", "tok" in text)
 
         # ── Phase 6: MCP Server - unfold_section ──────────────────
-        print("\n--- Phase 6: MCP Server - unfold_section ---")
+        phase("Phase 6: MCP Server - unfold_section")
         resp = mcp_call("tools/call",
                         {"name": "unfold_section", "arguments": {"fold_id": "fold-001"}})
 
@@ -268,14 +424,15 @@ def main():
                   f"got {len(text)} chars")
 
         # Verify state updated on disk
-        with open(state_path) as f:
-            state_after = json.load(f)
-        fold_001 = next(f for f in state_after["folds"] if f["id"] == "fold-001")
+        state_after = load_state_cached(state_path)
+        by_id = {f["id"]: f for f in state_after["folds"]}
+        fold_001 = by_id["fold-001"]
         check("fold-001 status is unfolded", fold_001["status"] == "unfolded")
 
         # ── Phase 7: MCP Server - write_summary ───────────────────
-        print("\n--- Phase 7: MCP Server - write_summary ---")
-        new_summary = "auth.mid>fix: jwt.decode>jwt.verify | sig.validation.added | D:auth.mid.ts"
+        phase("Phase 7: MCP Server - write_summary")
+        # Non-ASCII on purpose: exercises request framing end to end
+        new_summary = "auth.mid>fix: jwt.decode→jwt.verify | sig.validation.added | D:auth.mid.ts"
         resp = mcp_call("tools/call",
                         {"name": "write_summary",
                          "arguments": {"fold_id": "fold-001", "summary": new_summary}})
@@ -286,13 +443,13 @@ def main():
             check("write_summary confirms update", "updated" in text.lower())
 
         # Verify on disk
-        with open(state_path) as f:
-            state_after2 = json.load(f)
-        fold_001 = next(f for f in state_after2["folds"] if f["id"] == "fold-001")
+        state_after2 = load_state_cached(state_path)
+        by_id = {f["id"]: f for f in state_after2["folds"]}
+        fold_001 = by_id["fold-001"]
         check("summary updated on disk", fold_001["summary"] == new_summary)
 
         # ── Phase 8: MCP Server - fold_section ────────────────────
-        print("\n--- Phase 8: MCP Server - fold_section ---")
+        phase("Phase 8: MCP Server - fold_section")
         resp = mcp_call("tools/call",
                         {"name": "fold_section", "arguments": {"fold_id": "fold-001"}})
 
@@ -303,41 +460,82 @@ def main():
             check("fold shows summary", "auth.mid" in text)
 
         # Verify state
-        with open(state_path) as f:
-            state_after3 = json.load(f)
-        fold_001 = next(f for f in state_after3["folds"] if f["id"] == "fold-001")
+        state_after3 = load_state_cached(state_path)
+        by_id = {f["id"]: f for f in state_after3["folds"]}
+        fold_001 = by_id["fold-001"]
         check("fold-001 status back to folded", fold_001["status"] == "folded")
 
         # ── Phase 9: Error cases ──────────────────────────────────
-        print("\n--- Phase 9: Error Cases ---")
-        resp = mcp_call("tools/call",
-                        {"name": "unfold_section", "arguments": {"fold_id": "fold-999"}})
-        if resp and "result" in resp:
-            text = resp["result"]["content"][0]["text"]
-            check("unfold nonexistent fold returns error", "not found" in text.lower())
-
-        resp = mcp_call("tools/call",
-                        {"name": "fold_section", "arguments": {"fold_id": "fold-999"}})
-        if resp and "result" in resp:
-            text = resp["result"]["content"][0]["text"]
-            check("fold nonexistent fold returns error", "not found" in text.lower())
+        phase("Phase 9: Error Cases")
+        error_tools = ("unfold_section", "fold_section")
+        futures = mcp_send([
+            ("tools/call", {"name": tool, "arguments": NOT_FOUND_ARGS})
+            for tool in error_tools
+        ])
+        for tool, fut in zip(error_tools, futures):
+            resp = fut.result(timeout=MCP_TIMEOUT)
+            if resp and "result" in resp:
+                text = resp["result"]["content"][0]["text"]
+                action = tool.split("_")[0]
+                check(f"{action} nonexistent fold returns error",
+                      "not found" in text.lower())
 
         # ── Phase 10: Second compaction (idempotency) ─────────────
-        print("\n--- Phase 10: Second Compaction (idempotency) ---")
-        result3 = run_hook("precompact.py", hook_input)
+        phase("Phase 10: Second Compaction (idempotency)")
+        # Same transcript again
+        result3 = run_hook(PRECOMPACT_PY, hook_input)
         check("second precompact exits 0", result3.returncode == 0)
 
-        with open(state_path) as f:
-            state_after4 = json.load(f)
+        state_after4 = load_state_cached(state_path)
         check("fold count unchanged after re-run",
               len(state_after4["folds"]) == num_folds,
               f"was {num_folds}, now {len(state_after4['folds'])}")
 
+        # ── Phase 11: Prefetched turns (in-process only) ──────────
+        if not os.environ.get("E2E_ISOLATE"):
+            phase("Phase 11: PreCompact with prefetched turns")
+            # Decoded transcript lines, wrapped the way Claude Code writes them
+            turns = [{"type": t["role"], "message": t}
+                     for t in map(loads, build_transcript().splitlines())]
+            result4 = run_hook(PRECOMPACT_PY, "", prefetched_turns=turns)
+            check("prefetched precompact exits 0", result4.returncode == 0,
+                  f"exit={result4.returncode}, stderr={result4.stderr[:200]}")
+
+            state_after5 = load_state_cached(state_path)
+            check("fold count unchanged with prefetched turns",
+                  len(state_after5["folds"]) == num_folds,
+                  f"was {num_folds}, now {len(state_after5['folds'])}")
+
+        # ── Phase 12: Lone surrogate in state.json ────────────────
+        phase("Phase 12: Lone surrogate in state.json")
+        # JSON.stringify in the MCP server can write a lone surrogate
+        # escape; the hooks must load and re-save such a state
+        with open(state_path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        bad_summary = "bad \ud800 x"
+        raw["folds"][0]["summary"] = bad_summary
+        with open(state_path, "w", encoding="utf-8") as f:
+            json.dump(raw, f)
+
+        result5 = run_hook(SESSIONSTART_PY, dumps({"source": "compact"}))
+        check("sessionstart exits 0 with lone surrogate",
+              result5.returncode == 0,
+              f"exit={result5.returncode}, stderr={result5.stderr[-200:]}")
+        check("injection still emitted", "bad ? x" in result5.stdout)
+
+        with open(state_path, "r", encoding="utf-8") as f:
+            round_tripped = json.load(f)
+        check("lone surrogate survives save_state",
+              round_tripped["folds"][0]["summary"] == bad_summary)
+
     finally:
+        flush_log()
+        mcp_stop()
         os.unlink(transcript_path)
         cleanup()
 
     # ── Summary ───────────────────────────────────────────────────
+    flush_log()
     print("\n" + "=" * 60)
     total = PASS + FAIL
     print(f"RESULTS: {PASS}/{total} passed, {FAIL} failed")